@@ -1,6 +1,7 @@
 # api/app/core/config.py
 from pydantic_settings import BaseSettings
 from typing import List
+import orjson
 import os
 
 class Settings(BaseSettings):
@@ -8,14 +9,28 @@ class Settings(BaseSettings):
     API_TITLE: str = "Intelligent Document Understanding API"
     API_VERSION: str = "1.0.0"
     API_DESCRIPTION: str = "Extract structured information from unstructured documents"
+    GZIP_MIN_SIZE: int = 1024  # Bytes; smaller responses are sent uncompressed
     
     # Marqo Settings
     MARQO_URL: str = "http://localhost:8882"
     MARQO_INDEX_NAME: str = "document-types"
+    MARQO_TIMEOUT: float = 30.0  # Seconds, for direct HTTP calls to Marqo
+    # Documents can be embedded in-process with the same model as the index's
+    # "hf/all_datasets_v4_MiniLM-L6". Off by default so API workers don't load torch;
+    # populate_vector_db.py turns it on for bulk indexing.
+    CLIENT_SIDE_EMBEDDINGS: bool = False
+    EMBEDDING_MODEL: str = "flax-sentence-embeddings/all_datasets_v4_MiniLM-L6"
+    EMBEDDING_BATCH_SIZE: int = 128
+    EMBEDDING_SPLIT_LENGTH: int = 2  # Sentences per embedded chunk, as in Marqo's default text splitting
+    EMBEDDING_MAX_CHUNKS: int = 64  # Chunks embedded per document; later text is not searchable
     
     # OCR Settings
     TESSERACT_CMD: str = "tesseract"  # Will be overridden in Docker
+    TESSDATA_PREFIX: str = ""  # tessdata directory; empty uses libtesseract's compiled-in default
     OCR_CONFIG: str = "--oem 3 --psm 6"
+    OCR_DPI: int = 150  # PDF rasterization DPI; Tesseract's LSTM model peaks around here
+    OCR_BINARIZE: bool = True  # Grayscale + adaptive threshold before Tesseract
+    OCR_DENOISE: bool = False  # Non-local means denoising before thresholding; slow, for noisy scans
     
     # LLM Settings
     OPENAI_API_KEY: str = ""
@@ -26,6 +41,12 @@ class Settings(BaseSettings):
     ALLOWED_EXTENSIONS: List[str] = [".pdf", ".png", ".jpg", ".jpeg", ".tiff", ".bmp"]
     UPLOAD_DIR: str = "uploads"
     
+    # Cache Settings
+    CLASSIFICATION_CACHE_SIZE: int = 1024
+    CLASSIFICATION_CACHE_PREFIX: int = 4096  # Characters of text hashed for the cache key
+    CLASSIFICATION_CACHE_TTL: float = 300.0  # Seconds; bounds staleness after the index changes
+    STATS_CACHE_TTL: float = 60.0  # Seconds; also invalidated whenever this process writes to the index
+    
     # Document Types and Fields
     DOCUMENT_TYPES: dict = {
         "invoice": [
@@ -53,4 +74,12 @@ class Settings(BaseSettings):
         env_file = ".env"
         case_sensitive = True
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
+
+# Lookups derived from settings, computed once at import
+SUPPORTED_DOC_TYPES: tuple = tuple(settings.DOCUMENT_TYPES.keys())
+ALLOWED_EXT_SET: frozenset = frozenset(settings.ALLOWED_EXTENSIONS)
+TYPES_RESPONSE_BYTES: bytes = orjson.dumps({
+    "document_types": settings.DOCUMENT_TYPES,
+    "supported_types": SUPPORTED_DOC_TYPES
+})
@@ -23,18 +23,37 @@ class APIErrorResponse(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.now)
 
 # Utility functions for standardized responses
-from fastapi.responses import JSONResponse
+# SuccessResponse/APIErrorResponse document the shapes for OpenAPI; the helpers
+# below encode the same fields directly with orjson in a single pass.
+import orjson
+from fastapi.responses import Response
 
-def success_response(data: Any = None, message: Optional[str] = None) -> JSONResponse:
-    return JSONResponse(
+def _orjson_default(obj: Any) -> Any:
+    """Serialize values orjson does not handle natively (e.g. Pydantic models)"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def success_response(data: Any = None, message: Optional[str] = None) -> Response:
+    return Response(
+        content=orjson.dumps(
+            {"success": True, "message": message, "data": data},
+            default=_orjson_default
+        ),
         status_code=200,
-        content=SuccessResponse(data=data, message=message).dict()
+        media_type="application/json"
     )
 
-def error_response(error: str, detail: Optional[str] = None, status_code: int = 400) -> JSONResponse:
-    return JSONResponse(
+def error_response(error: str, detail: Optional[str] = None, status_code: int = 400) -> Response:
+    return Response(
+        content=orjson.dumps({
+            "success": False,
+            "error": error,
+            "detail": detail,
+            "timestamp": datetime.now()
+        }),
         status_code=status_code,
-        content=APIErrorResponse(error=error, detail=detail).dict()
+        media_type="application/json"
     )
 
 # Re-export main response models for convenience
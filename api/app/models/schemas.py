@@ -15,6 +15,15 @@ class DocumentClassification(BaseModel):
     confidence: float
     similar_documents: List[Dict[str, Any]] = []
 
+class BatchClassificationItem(BaseModel):
+    text: str
+
+class BatchClassificationRequest(BaseModel):
+    items: List[BatchClassificationItem] = Field(..., min_length=1, max_length=64)
+
+class BatchClassificationResponse(BaseModel):
+    results: List[DocumentClassification]
+
 class EntityExtractionRequest(BaseModel):
     text: str
     document_type: str
@@ -1,35 +1,48 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, BackgroundTasks, Request
+from fastapi.responses import ORJSONResponse, Response
+import asyncio
+import orjson
+import os
 import time
-from typing import List
+from types import SimpleNamespace
+from typing import Any, Dict, List
 from loguru import logger
 
-from ..services.ocr_service import OCRService
-from ..services.classification_service import DocumentClassificationService
-from ..services.extraction_service import EntityExtractionService
 from ..services.vector_service import VectorService
 from ..models.schemas import (
     DocumentUploadResponse, 
     DocumentClassification,
+    BatchClassificationRequest,
+    BatchClassificationResponse,
     EntityExtractionRequest,
-    EntityExtractionResponse,
-    ProcessingStats
+    EntityExtractionResponse
 )
-from ..core.config import settings
+from ..core.config import settings, TYPES_RESPONSE_BYTES
 from ..core.exceptions import DocumentProcessingException
+from ..utils.file_utils import validate_file_extension, generate_unique_filename, save_uploaded_file, cleanup_file
+from ..utils.http_utils import GzipRoute
 
-router = APIRouter()
+router = APIRouter(default_response_class=ORJSONResponse, route_class=GzipRoute)
 
-# Initialize services
-ocr_service = OCRService()
-classification_service = DocumentClassificationService()
-extraction_service = EntityExtractionService()
-vector_service = VectorService()
+MAX_FILE_SIZE_MB = settings.MAX_FILE_SIZE // (1024 * 1024)
 
-@router.post("/extract_entities", response_model=DocumentUploadResponse)
+def get_services(request: Request) -> SimpleNamespace:
+    """Shared service instances, created once in the application lifespan"""
+    return request.app.state.services
+
+async def _store_document(vector_service: VectorService, document: Dict[str, Any]) -> None:
+    """Store a processed document in the vector database (runs after the response is sent)"""
+    try:
+        await vector_service.add_documents([document])
+    except Exception as e:
+        logger.warning(f"Failed to store document in vector DB: {str(e)}")
+
+@router.post("/extract_entities", responses={200: {"model": DocumentUploadResponse}})
 async def extract_entities_from_document(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    include_raw_text: bool = False
+    include_raw_text: bool = False,
+    services: SimpleNamespace = Depends(get_services)
 ):
     """
     Extract entities from an uploaded document (full pipeline: OCR, classification, entity extraction, storage).
@@ -37,6 +50,7 @@ async def extract_entities_from_document(
     - **file**: Document file (PDF, PNG, JPG, JPEG, TIFF, BMP)
     - **include_raw_text**: Whether to include raw OCR text in response
     """
+    file_path = None
     try:
         start_time = time.time()
         
@@ -44,25 +58,29 @@ async def extract_entities_from_document(
         if not file.filename:
             raise HTTPException(status_code=400, detail="No file provided")
         
-        file_extension = file.filename.lower().split('.')[-1]
-        if f".{file_extension}" not in settings.ALLOWED_EXTENSIONS:
+        if not validate_file_extension(file.filename):
             raise HTTPException(
                 status_code=400, 
                 detail=f"File type not supported. Allowed: {settings.ALLOWED_EXTENSIONS}"
             )
         
-        # Read file content
-        file_content = await file.read()
-        if len(file_content) > settings.MAX_FILE_SIZE:
+        # Stream the upload to disk instead of holding it in memory
+        if file.size is None or file.size <= settings.MAX_FILE_SIZE:
+            file_path = await save_uploaded_file(file, generate_unique_filename(file.filename), settings.UPLOAD_DIR)
+        if file_path is None or os.path.getsize(file_path) > settings.MAX_FILE_SIZE:
             raise HTTPException(
-                status_code=400, 
-                detail=f"File too large. Max size: {settings.MAX_FILE_SIZE // (1024*1024)}MB"
+                status_code=413, 
+                detail=f"File too large. Max size: {MAX_FILE_SIZE_MB}MB"
             )
         
         # Step 1: OCR Processing
         ocr_start = time.time()
         logger.info(f"Starting OCR for file: {file.filename}")
-        raw_text = await ocr_service.extract_text_from_file(file_content, file.filename)
+        # Warm up the vector index while OCR runs; a no-op once the index is ready
+        raw_text, _ = await asyncio.gather(
+            services.ocr.extract_text_from_file(file_path, file.filename),
+            services.vector._ensure_index_exists_async()
+        )
         ocr_time = time.time() - ocr_start
         
         if not raw_text.strip():
@@ -71,31 +89,28 @@ async def extract_entities_from_document(
         # Step 2: Document Classification
         classification_start = time.time()
         logger.info("Starting document classification")
-        classification = await classification_service.classify_document(raw_text)
+        classification = await services.classification.classify_document(raw_text)
         classification_time = time.time() - classification_start
         
         # Step 3: Entity Extraction
         extraction_start = time.time()
         logger.info(f"Starting entity extraction for type: {classification.document_type}")
-        extraction_result = await extraction_service.extract_entities(
+        extraction_result = await services.extraction.extract_entities(
             raw_text, 
             classification.document_type
         )
         extraction_time = time.time() - extraction_start
         
-        # Step 4: Store in vector database (optional)
-        try:
-            await vector_service.add_documents([{
-                "text": raw_text,
-                "document_type": classification.document_type,
-                "filename": file.filename,
-                "metadata": {
-                    "confidence": classification.confidence,
-                    "entities": extraction_result.entities
-                }
-            }])
-        except Exception as e:
-            logger.warning(f"Failed to store document in vector DB: {str(e)}")
+        # Step 4: Store in vector database (optional, after the response is sent)
+        background_tasks.add_task(_store_document, services.vector, {
+            "text": raw_text,
+            "document_type": classification.document_type,
+            "filename": file.filename,
+            "metadata": {
+                "confidence": classification.confidence,
+                "entities": extraction_result.entities
+            }
+        })
         
         total_time = time.time() - start_time
         
@@ -105,12 +120,12 @@ async def extract_entities_from_document(
             "confidence": classification.confidence,
             "entities": extraction_result.entities,
             "processing_time": f"{total_time:.2f}s",
-            "processing_stats": ProcessingStats(
-                ocr_time=ocr_time,
-                classification_time=classification_time,
-                extraction_time=extraction_time,
-                total_time=total_time
-            ).dict()
+            "processing_stats": {
+                "ocr_time": ocr_time,
+                "classification_time": classification_time,
+                "extraction_time": extraction_time,
+                "total_time": total_time
+            }
         }
         
         if include_raw_text:
@@ -121,17 +136,25 @@ async def extract_entities_from_document(
         
         logger.info(f"Document processing completed in {total_time:.2f}s")
         
-        return DocumentUploadResponse(**response_data)
+        return ORJSONResponse(content=response_data)
         
+    except HTTPException:
+        raise
     except DocumentProcessingException as e:
         logger.error(f"Document processing error: {str(e)}")
         raise
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
+    finally:
+        if file_path:
+            cleanup_file(file_path)
 
 @router.post("/classify", response_model=DocumentClassification)
-async def classify_document_text(text: str = Form(...)):
+async def classify_document_text(
+    text: str = Form(...),
+    services: SimpleNamespace = Depends(get_services)
+):
     """
     Classify document type from text content
     """
@@ -139,15 +162,40 @@ async def classify_document_text(text: str = Form(...)):
         if not text.strip():
             raise HTTPException(status_code=400, detail="Text content is required")
         
-        classification = await classification_service.classify_document(text)
+        classification = await services.classification.classify_document(text)
         return classification
         
     except Exception as e:
         logger.error(f"Classification error: {str(e)}")
         raise HTTPException(status_code=500, detail="Classification failed")
 
+@router.post("/classify:batch", response_model=BatchClassificationResponse)
+async def classify_document_batch(
+    request: BatchClassificationRequest,
+    services: SimpleNamespace = Depends(get_services)
+):
+    """
+    Classify several texts in one request; results are returned in request order
+    """
+    if any(not item.text.strip() for item in request.items):
+        raise HTTPException(status_code=400, detail="Text content is required for every item")
+    
+    try:
+        results = await asyncio.gather(*(
+            services.classification.classify_document(item.text)
+            for item in request.items
+        ))
+        return BatchClassificationResponse(results=results)
+        
+    except Exception as e:
+        logger.error(f"Batch classification error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Classification failed")
+
 @router.post("/extract", response_model=EntityExtractionResponse)
-async def extract_entities(request: EntityExtractionRequest):
+async def extract_entities(
+    request: EntityExtractionRequest,
+    services: SimpleNamespace = Depends(get_services)
+):
     """
     Extract entities from text for a specific document type
     """
@@ -158,7 +206,7 @@ async def extract_entities(request: EntityExtractionRequest):
         if not request.document_type:
             raise HTTPException(status_code=400, detail="Document type is required")
         
-        result = await extraction_service.extract_entities(
+        result = await services.extraction.extract_entities(
             request.text, 
             request.document_type
         )
@@ -174,62 +222,63 @@ async def get_supported_document_types():
     Get list of supported document types and their fields
     """
     try:
-        return {
-            "document_types": settings.DOCUMENT_TYPES,
-            "supported_types": list(settings.DOCUMENT_TYPES.keys())
-        }
+        return Response(content=TYPES_RESPONSE_BYTES, media_type="application/json")
     except Exception as e:
         logger.error(f"Error getting document types: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get document types")
 
 @router.get("/stats")
-async def get_processing_stats():
+async def get_processing_stats(services: SimpleNamespace = Depends(get_services)):
     """
     Get processing statistics and document type distribution
     """
     try:
-        stats = await classification_service.get_classification_stats()
-        return stats
+        stats = await services.classification.get_classification_stats()
+        return Response(content=orjson.dumps(stats), media_type="application/json")
     except Exception as e:
         logger.error(f"Error getting stats: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get statistics")
 
 @router.delete("/vector-db")
-async def clear_vector_database():
+async def clear_vector_database(services: SimpleNamespace = Depends(get_services)):
     """
     Clear the vector database (for testing/reset purposes)
     """
     try:
-        await vector_service.delete_index()
-        return {"message": "Vector database cleared successfully"}
+        await services.vector.delete_index()
+        return Response(
+            content=orjson.dumps({"message": "Vector database cleared successfully"}),
+            media_type="application/json"
+        )
     except Exception as e:
         logger.error(f"Error clearing vector DB: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to clear vector database")
 
 @router.get("/vector-db-status")
-async def check_vector_db_status():
+async def check_vector_db_status(services: SimpleNamespace = Depends(get_services)):
     """
     Check the status of the vector database connection
     """
     try:
         # Try to connect to Marqo and get indexes
-        is_connected = await vector_service._ensure_index_exists_async()
+        is_connected = await services.vector._ensure_index_exists_async()
         if is_connected:
-            indexes = vector_service.client.get_indexes()
-            return {
+            indexes = services.vector.client.get_indexes()
+            status = {
                 "status": "connected",
                 "indexes": indexes,
-                "index_name": vector_service.index_name,
-                "index_ready": vector_service._index_ready
+                "index_name": services.vector.index_name,
+                "index_ready": services.vector.index_ready
             }
         else:
-            return {
+            status = {
                 "status": "disconnected",
                 "reason": "Failed to connect to Marqo after retries"
             }
     except Exception as e:
         logger.error(f"Error checking vector DB status: {str(e)}")
-        return {
+        status = {
             "status": "error",
             "error": str(e)
         }
+    return Response(content=orjson.dumps(status), media_type="application/json")
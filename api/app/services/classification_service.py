@@ -1,17 +1,73 @@
 # api/app/services/classification_service.py
-from typing import Dict, Any, List
+import asyncio
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
 from loguru import logger
+from cachetools import TTLCache
+import ahocorasick
+import xxhash
 from .vector_service import VectorService
 from ..models.schemas import DocumentClassification
-from ..core.config import settings
+from ..core.config import settings, SUPPORTED_DOC_TYPES
+
+# Keyword patterns for the fallback classifier
+KEYWORD_PATTERNS = {
+    "invoice": [
+        "invoice", "bill", "amount due", "total", "subtotal", 
+        "tax", "payment terms", "vendor", "supplier"
+    ],
+    "receipt": [
+        "receipt", "purchased", "store", "cashier", "thank you",
+        "change", "payment method", "card", "cash"
+    ],
+    "contract": [
+        "contract", "agreement", "party", "terms", "conditions",
+        "signature", "effective date", "termination"
+    ],
+    "id_document": [
+        "identification", "license", "passport", "id card",
+        "date of birth", "expires", "issued by"
+    ],
+    "bank_statement": [
+        "statement", "account", "balance", "transaction",
+        "deposit", "withdrawal", "bank", "branch"
+    ]
+}
+
+# Text is casefolded and scanned in windows of this many characters
+KEYWORD_SCAN_WINDOW = 64 * 1024
 
 class DocumentClassificationService:
-    def __init__(self):
-        self.vector_service = VectorService()
-        self.document_types = list(settings.DOCUMENT_TYPES.keys())
+    def __init__(self, vector_service: Optional[VectorService] = None):
+        self.vector_service = vector_service or VectorService()
+        self.document_types = SUPPORTED_DOC_TYPES
+        self._type_set = frozenset(self.document_types)
+        
+        # Build a single automaton so all keywords are matched in one pass
+        self._ac = ahocorasick.Automaton()
+        for doc_type, keywords in KEYWORD_PATTERNS.items():
+            for keyword in keywords:
+                self._ac.add_word(keyword, (doc_type, keyword))
+        self._ac.make_automaton()
+        self._kw_counts = {doc_type: len(keywords) for doc_type, keywords in KEYWORD_PATTERNS.items()}
+        # Windows overlap by this much so no keyword is split across a boundary
+        self._scan_overlap = max(len(keyword) for keywords in KEYWORD_PATTERNS.values() for keyword in keywords) - 1
+        
+        # Vector-search results keyed by a hash of the text prefix; repeated templates
+        # skip the vector DB until the entry expires
+        self._cache = TTLCache(
+            maxsize=settings.CLASSIFICATION_CACHE_SIZE,
+            ttl=settings.CLASSIFICATION_CACHE_TTL
+        )
     
     async def classify_document(self, text: str) -> DocumentClassification:
         """Classify document type based on text content"""
+        cache_key = xxhash.xxh3_64_intdigest(text[:settings.CLASSIFICATION_CACHE_PREFIX].encode())
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            logger.info("Returning cached document classification")
+            return cached
+        
         try:
             logger.info("Starting document classification")
             
@@ -23,20 +79,26 @@ class DocumentClassificationService:
             )
             
             if not similar_docs:
-                # Fallback to keyword-based classification
-                return await self._keyword_based_classification(text)
+                # Fallback to keyword-based classification (CPU-bound, keep it off the event loop)
+                classification = await asyncio.to_thread(self._keyword_based_classification, text)
+            else:
+                # Analyze similar documents to determine type
+                type_scores = self._calculate_type_scores(similar_docs)
+                
+                # Get the most likely document type
+                best_type, confidence = self._get_best_classification(type_scores)
+                
+                classification = DocumentClassification(
+                    document_type=best_type,
+                    confidence=confidence,
+                    similar_documents=similar_docs[:3]  # Return top 3 similar docs
+                )
+                
+                # Keyword fallbacks are not cached: an empty result may just mean
+                # Marqo was unavailable, and the next call should retry it
+                self._cache[cache_key] = classification
             
-            # Analyze similar documents to determine type
-            type_scores = self._calculate_type_scores(similar_docs)
-            
-            # Get the most likely document type
-            best_type, confidence = self._get_best_classification(type_scores)
-            
-            return DocumentClassification(
-                document_type=best_type,
-                confidence=confidence,
-                similar_documents=similar_docs[:3]  # Return top 3 similar docs
-            )
+            return classification
             
         except Exception as e:
             logger.error(f"Document classification failed: {str(e)}")
@@ -49,22 +111,22 @@ class DocumentClassificationService:
     
     def _calculate_type_scores(self, similar_docs: List[Dict[str, Any]]) -> Dict[str, float]:
         """Calculate weighted scores for each document type"""
-        type_scores = {doc_type: 0.0 for doc_type in self.document_types}
+        totals = defaultdict(float)
+        total_score = 0.0
         
         for doc in similar_docs:
-            doc_type = doc.get("document_type", "unknown")
-            score = doc.get("score", 0.0)
-            
-            if doc_type in type_scores:
+            doc_type = doc.get("document_type")
+            if doc_type in self._type_set:
                 # Weight the score by similarity
-                type_scores[doc_type] += score
+                score = doc.get("score", 0.0)
+                totals[doc_type] += score
+                total_score += score
         
         # Normalize scores
-        total_score = sum(type_scores.values())
         if total_score > 0:
-            type_scores = {k: v / total_score for k, v in type_scores.items()}
+            return {k: v / total_score for k, v in totals.items()}
         
-        return type_scores
+        return {}
     
     def _get_best_classification(self, type_scores: Dict[str, float]) -> tuple:
         """Get the best document type and confidence score"""
@@ -76,45 +138,18 @@ class DocumentClassificationService:
         
         return best_type, confidence
     
-    async def _keyword_based_classification(self, text: str) -> DocumentClassification:
+    def _keyword_based_classification(self, text: str) -> DocumentClassification:
         """Fallback keyword-based classification when vector search fails"""
-        text_lower = text.lower()
+        hits = {doc_type: set() for doc_type in KEYWORD_PATTERNS}
+        for _, (doc_type, keyword) in self._iter_keyword_hits(text):
+            hits[doc_type].add(keyword)
         
-        # Define keyword patterns for each document type
-        keyword_patterns = {
-            "invoice": [
-                "invoice", "bill", "amount due", "total", "subtotal", 
-                "tax", "payment terms", "vendor", "supplier"
-            ],
-            "receipt": [
-                "receipt", "purchased", "store", "cashier", "thank you",
-                "change", "payment method", "card", "cash"
-            ],
-            "contract": [
-                "contract", "agreement", "party", "terms", "conditions",
-                "signature", "effective date", "termination"
-            ],
-            "id_document": [
-                "identification", "license", "passport", "id card",
-                "date of birth", "expires", "issued by"
-            ],
-            "bank_statement": [
-                "statement", "account", "balance", "transaction",
-                "deposit", "withdrawal", "bank", "branch"
-            ]
+        # Normalize by number of keywords
+        type_scores = {
+            doc_type: len(found) / self._kw_counts[doc_type]
+            for doc_type, found in hits.items()
         }
         
-        type_scores = {}
-        
-        for doc_type, keywords in keyword_patterns.items():
-            score = 0
-            for keyword in keywords:
-                if keyword in text_lower:
-                    score += 1
-            
-            # Normalize by number of keywords
-            type_scores[doc_type] = score / len(keywords)
-        
         best_type, confidence = self._get_best_classification(type_scores)
         
         # Lower confidence for keyword-based classification
@@ -128,7 +163,15 @@ class DocumentClassificationService:
             similar_documents=[]
         )
     
-    async def get_supported_document_types(self) -> List[str]:
+    def _iter_keyword_hits(self, text: str):
+        """Yield automaton matches over the casefolded text, one bounded window at a time"""
+        # Only one window is casefolded at a time, so large OCR output is never
+        # copied in full; matches in the overlap may repeat but hits are sets
+        for start in range(0, len(text), KEYWORD_SCAN_WINDOW):
+            window = text[start:start + KEYWORD_SCAN_WINDOW + self._scan_overlap]
+            yield from self._ac.iter(window.casefold())
+    
+    async def get_supported_document_types(self) -> Tuple[str, ...]:
         """Get list of supported document types"""
         return self.document_types
     
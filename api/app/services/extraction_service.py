@@ -1,17 +1,86 @@
 # api/app/services/extraction_service.py
-from langchain.llms import OpenAI
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import PromptTemplate
-from langchain.schema import HumanMessage
-import json
+# langchain is imported lazily inside the methods that use it; it is slow to
+# import and weighs several MB per worker.
+import orjson
 import re
-from typing import Dict, Any, List
+from typing import Callable, Dict, Any, Optional, Sequence
 from loguru import logger
 from ..core.config import settings
 from ..models.schemas import EntityExtractionResponse
 
+# Precompiled patterns used on every extraction
+_DATE_PREFIX_RE = re.compile(r'^(date:?|on:?)\s*', re.IGNORECASE)
+_AMT_PREFIX_RE = re.compile(r'^(total:?|amount:?|sum:?)\s*', re.IGNORECASE)
+_PHONE_RE = re.compile(r'[^\d\+\-\(\)\s]')
+_DATE_FMTS = [
+    re.compile(r'\d{4}-\d{2}-\d{2}'),  # YYYY-MM-DD
+    re.compile(r'\d{1,2}/\d{1,2}/\d{2,4}'),  # MM/DD/YYYY
+    re.compile(r'\d{1,2}-\d{1,2}-\d{2,4}'),  # MM-DD-YYYY
+]
+
+# Extraction prompt, split around the document text. The head is rendered
+# once per document type; the text and tail are appended per request.
+_PROMPT_HEAD = """
+You are an expert document analyzer. Extract specific information from the given document text.
+
+Document Type: {document_type}
+Required Fields: {field_list}
+
+Instructions:
+1. Extract ONLY the requested fields from the document
+2. Return the information as a valid JSON object
+3. Use null for fields that cannot be found or determined
+4. Be precise and accurate with the extracted values
+5. For dates, use YYYY-MM-DD format
+6. For monetary amounts, include currency symbol
+
+Document Text:
+"""
+_PROMPT_TAIL = """
+
+Return only the JSON object with no additional text:
+"""
+# Limit text length for LLM
+_MAX_PROMPT_TEXT = 4000
+
+def _find_json(response: str) -> Optional[str]:
+    """Return the first balanced {...} block in the response, or None"""
+    start = response.find('{')
+    if start == -1:
+        return None
+    
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(response)):
+        char = response[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return response[start:i + 1]
+    return None
+
+def _identity(value: str) -> str:
+    return value
+
 class EntityExtractionService:
+    # Values the LLM uses to mean "not found"
+    _NULL_TOKENS = frozenset({'null', 'none', 'n/a', ''})
+    
     def __init__(self):
+        from langchain.chat_models import ChatOpenAI
+        
         # Fix for LangChain compatibility - use proper initialization
         try:
             self.llm = ChatOpenAI(
@@ -32,40 +101,38 @@ class EntityExtractionService:
                 logger.error(f"Failed to initialize ChatOpenAI: {e2}")
                 self.llm = None
         
-        self.prompt_templates = self._create_prompt_templates()
+        self._rendered_prefix = self._create_prompt_prefixes()
+        
+        # Per-type (fields, prompt prefix) pairs, resolved once instead of on every call
+        self._type_spec = {
+            doc_type: (tuple(fields), self._rendered_prefix[doc_type])
+            for doc_type, fields in settings.DOCUMENT_TYPES.items()
+        }
+        
+        # Field name -> value cleaner, classified once from the known fields
+        self._cleaners: Dict[str, Callable[[str], str]] = {
+            field: self._select_cleaner(field)
+            for fields in settings.DOCUMENT_TYPES.values()
+            for field in fields
+        }
     
-    def _create_prompt_templates(self) -> Dict[str, PromptTemplate]:
-        """Create prompt templates for different document types"""
-        templates = {}
+    def _create_prompt_prefixes(self) -> Dict[str, str]:
+        """Render the type-specific part of the extraction prompt for each document type"""
+        from langchain.prompts import PromptTemplate
         
-        base_template = """
-You are an expert document analyzer. Extract specific information from the given document text.
-
-Document Type: {document_type}
-Required Fields: {field_list}
-
-Instructions:
-1. Extract ONLY the requested fields from the document
-2. Return the information as a valid JSON object
-3. Use null for fields that cannot be found or determined
-4. Be precise and accurate with the extracted values
-5. For dates, use YYYY-MM-DD format
-6. For monetary amounts, include currency symbol
-
-Document Text:
-{document_text}
-
-Return only the JSON object with no additional text:
-"""
+        # One template shared by all document types
+        template = PromptTemplate(
+            input_variables=["document_type", "field_list"],
+            template=_PROMPT_HEAD
+        )
         
-        # Create specific templates for each document type
-        for doc_type in settings.DOCUMENT_TYPES.keys():
-            templates[doc_type] = PromptTemplate(
-                input_variables=["document_type", "field_list", "document_text"],
-                template=base_template
+        return {
+            doc_type: template.format(
+                document_type=doc_type.title(),
+                field_list=", ".join(fields)
             )
-        
-        return templates
+            for doc_type, fields in settings.DOCUMENT_TYPES.items()
+        }
     
     async def extract_entities(
         self, 
@@ -80,14 +147,15 @@ Return only the JSON object with no additional text:
             
             logger.info(f"Extracting entities for document type: {document_type}")
             
-            # Get fields for this document type
-            fields = settings.DOCUMENT_TYPES.get(document_type, [])
-            if not fields:
+            # Get fields and template for this document type
+            spec = self._type_spec.get(document_type)
+            if spec is None:
                 logger.warning(f"No fields defined for document type: {document_type}")
                 return EntityExtractionResponse(entities={})
+            fields, prefix = spec
             
             # Create prompt
-            prompt = self._create_extraction_prompt(text, document_type, fields)
+            prompt = self._create_extraction_prompt(text, prefix)
             
             # Get LLM response
             response = await self._get_llm_response(prompt)
@@ -107,29 +175,18 @@ Return only the JSON object with no additional text:
             logger.error(f"Entity extraction failed: {str(e)}")
             return EntityExtractionResponse(entities={})
     
-    def _create_extraction_prompt(
-        self, 
-        text: str, 
-        document_type: str, 
-        fields: List[str]
-    ) -> str:
+    def _create_extraction_prompt(self, text: str, prefix: str) -> str:
         """Create extraction prompt for the given document"""
-        template = self.prompt_templates.get(document_type)
-        if not template:
-            template = self.prompt_templates["invoice"]  # Use default template
-        
-        return template.format(
-            document_type=document_type.title(),
-            field_list=", ".join(fields),
-            document_text=text[:4000]  # Limit text length for LLM
-        )
+        # Single join, no intermediate strings; slicing a short text returns it uncopied
+        return "".join((prefix, text[:_MAX_PROMPT_TEXT], _PROMPT_TAIL))
     
     async def _get_llm_response(self, prompt: str) -> str:
         """Get response from LLM"""
+        from langchain.schema import HumanMessage
+        
         try:
-            message = HumanMessage(content=prompt)
-            response = await self.llm.agenerate([[message]])
-            return response.generations[0][0].text.strip()
+            response = await self.llm.ainvoke([HumanMessage(content=prompt)])
+            return response.content.strip()
         except Exception as e:
             logger.error(f"LLM request failed: {str(e)}")
             raise
@@ -138,14 +195,13 @@ Return only the JSON object with no additional text:
         """Parse JSON response from LLM"""
         try:
             # Try to extract JSON from response
-            json_match = re.search(r'\{.*\}', response, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-                return json.loads(json_str)
+            json_str = _find_json(response)
+            if json_str is not None:
+                return orjson.loads(json_str)
             else:
                 # Try parsing the entire response as JSON
-                return json.loads(response)
-        except json.JSONDecodeError as e:
+                return orjson.loads(response)
+        except orjson.JSONDecodeError as e:
             logger.error(f"Failed to parse JSON response: {str(e)}")
             logger.error(f"Raw response: {response}")
             return {}
@@ -153,58 +209,60 @@ Return only the JSON object with no additional text:
     def _validate_entities(
         self, 
         entities: Dict[str, Any], 
-        expected_fields: List[str]
+        expected_fields: Sequence[str]
     ) -> Dict[str, Any]:
         """Validate and clean extracted entities"""
         validated = {}
         
         for field in expected_fields:
             value = entities.get(field)
+            if value is None:
+                validated[field] = None
+                continue
             
             # Clean and validate the value
-            if value is not None and str(value).strip():
-                cleaned_value = str(value).strip()
-                if cleaned_value.lower() not in ['null', 'none', 'n/a', '']:
-                    validated[field] = self._clean_field_value(field, cleaned_value)
-                else:
-                    validated[field] = None
-            else:
+            cleaned_value = (value if isinstance(value, str) else str(value)).strip()
+            if cleaned_value.lower() in self._NULL_TOKENS:
                 validated[field] = None
+            else:
+                validated[field] = self._cleaners.get(field, _identity)(cleaned_value)
         
         return validated
     
-    def _clean_field_value(self, field_name: str, value: str) -> str:
-        """Clean specific field values based on field type"""
+    def _select_cleaner(self, field_name: str) -> Callable[[str], str]:
+        """Pick the value cleaner for a field based on its name"""
+        name = field_name.lower()
+        
         # Date fields
-        if 'date' in field_name.lower():
-            return self._clean_date_value(value)
+        if 'date' in name:
+            return self._clean_date_value
         
         # Amount fields
-        if any(word in field_name.lower() for word in ['amount', 'total', 'balance', 'value']):
-            return self._clean_amount_value(value)
+        if any(word in name for word in ['amount', 'total', 'balance', 'value']):
+            return self._clean_amount_value
         
         # Phone fields
-        if 'phone' in field_name.lower():
-            return self._clean_phone_value(value)
+        if 'phone' in name:
+            return self._clean_phone_value
         
-        return value
+        return _identity
     
     def _clean_date_value(self, value: str) -> str:
         """Clean date values"""
         # Remove extra whitespace and common prefixes
-        value = re.sub(r'^(date:?|on:?)\s*', '', value, flags=re.IGNORECASE)
+        value = _DATE_PREFIX_RE.sub('', value)
         return value.strip()
     
     def _clean_amount_value(self, value: str) -> str:
         """Clean monetary amount values"""
         # Remove extra whitespace and common prefixes
-        value = re.sub(r'^(total:?|amount:?|sum:?)\s*', '', value, flags=re.IGNORECASE)
+        value = _AMT_PREFIX_RE.sub('', value)
         return value.strip()
     
     def _clean_phone_value(self, value: str) -> str:
         """Clean phone number values"""
         # Remove non-numeric characters except + and -
-        return re.sub(r'[^\d\+\-\(\)\s]', '', value)
+        return _PHONE_RE.sub('', value)
     
     def _calculate_confidence_scores(
         self, 
@@ -232,14 +290,7 @@ Return only the JSON object with no additional text:
     
     def _is_valid_date_format(self, value: str) -> bool:
         """Check if value is in a valid date format"""
-        import re
-        date_patterns = [
-            r'\d{4}-\d{2}-\d{2}',  # YYYY-MM-DD
-            r'\d{1,2}/\d{1,2}/\d{2,4}',  # MM/DD/YYYY
-            r'\d{1,2}-\d{1,2}-\d{2,4}',  # MM-DD-YYYY
-        ]
-        
-        for pattern in date_patterns:
-            if re.match(pattern, value):
+        for pattern in _DATE_FMTS:
+            if pattern.match(value):
                 return True
         return False
\ No newline at end of file
@@ -1,28 +1,131 @@
 # api/app/services/ocr_service.py
-import pytesseract
+# tesserocr is imported lazily (see _create_api) so pool workers can set
+# OMP_THREAD_LIMIT before libtesseract and its OpenMP runtime are loaded.
 from PIL import Image
-import pdf2image
+import cv2
+import numpy as np
+import pypdfium2 as pdfium
+import asyncio
 import io
+import multiprocessing
 import os
-from typing import Union, List
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Union, List
 from loguru import logger
 from ..core.config import settings
 
+# Limit PDFs to their first pages for performance
+PDF_MAX_PAGES = 5
+# PDFs with less embedded text than this are treated as scans and OCRed
+MIN_EMBEDDED_TEXT_LENGTH = 50
+
+# Tesseract handle owned by a pool worker process
+_worker_api = None
+# Adaptive threshold parameters: neighbourhood size (odd, in pixels) and offset from the local mean
+THRESHOLD_BLOCK_SIZE = 31
+THRESHOLD_OFFSET = 10
+
+# PDFium is not thread-safe; serialize document access across worker threads
+_pdfium_lock = threading.Lock()
+
+def _tesseract_options(config: str) -> dict:
+    """Translate the CLI-style OCR_CONFIG (e.g. "--oem 3 --psm 6") into PyTessBaseAPI options"""
+    tokens = config.split()
+    options = {}
+    for flag, name in (("--psm", "psm"), ("--oem", "oem")):
+        if flag in tokens:
+            options[name] = int(tokens[tokens.index(flag) + 1])
+    return options
+
+def _create_api():
+    """Create a Tesseract API handle; the language model is loaded once and reused"""
+    import tesserocr
+    options = _tesseract_options(settings.OCR_CONFIG)
+    if settings.TESSDATA_PREFIX:
+        options['path'] = settings.TESSDATA_PREFIX
+    return tesserocr.PyTessBaseAPI(lang='eng', **options)
+
+def _recognize(api, image: Image.Image) -> str:
+    api.SetImage(image)
+    return api.GetUTF8Text()
+
+def init_ocr_worker() -> None:
+    """Process pool initializer: one single-threaded Tesseract per worker"""
+    global _worker_api
+    # Tesseract's OpenMP threading scales poorly; parallelism comes from the pool
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+    _worker_api = _create_api()
+
+def _preprocess(image: Image.Image) -> Image.Image:
+    """Prepare an image for Tesseract: grayscale + adaptive threshold, so it gets one 8-bit channel"""
+    if not settings.OCR_BINARIZE:
+        return image if image.mode in ('RGB', 'L') else image.convert('RGB')
+    
+    gray = np.asarray(image.convert('L'))
+    if settings.OCR_DENOISE:
+        gray = cv2.fastNlMeansDenoising(gray)
+    binary = cv2.adaptiveThreshold(
+        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+        THRESHOLD_BLOCK_SIZE, THRESHOLD_OFFSET
+    )
+    return Image.fromarray(binary)
+
+def ocr_page(image: Image.Image) -> str:
+    """OCR a single page image (runs in a pool worker)"""
+    return _recognize(_worker_api, _preprocess(image))
+
+def clean_ocr_text(text: str) -> str:
+    """Clean and preprocess extracted text"""
+    if not text:
+        return ""
+    
+    # Strip each line and filter out very short ones, in a single pass inside join
+    return '\n'.join(line for line in (raw.strip() for raw in text.splitlines()) if len(line) > 2)
+
 class OCRService:
     def __init__(self):
-        # Set tesseract command path if in Docker
-        if os.getenv('TESSERACT_CMD'):
-            pytesseract.pytesseract.tesseract_cmd = os.getenv('TESSERACT_CMD')
+        # PyTessBaseAPI is not thread-safe; all use of the shared handle takes the lock.
+        # It is created on first use, so a Tesseract problem fails OCR requests, not startup.
+        self._api = None
+        self._api_lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+    
+    def _get_api(self):
+        """Return the shared Tesseract handle, creating it on first use (caller holds _api_lock)"""
+        if self._api is None:
+            self._api = _create_api()
+        return self._api
+    
+    def _get_pool(self) -> ProcessPoolExecutor:
+        """Lazily start the process pool used for multi-page OCR"""
+        if self._pool is None:
+            # Spawned (not forked) workers, so OMP_THREAD_LIMIT is set before Tesseract loads
+            self._pool = ProcessPoolExecutor(
+                max_workers=min(PDF_MAX_PAGES, os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_ocr_worker
+            )
+        return self._pool
     
-    async def extract_text_from_file(self, file_content: bytes, filename: str) -> str:
-        """Extract text from uploaded file (PDF or image)"""
+    def close(self):
+        """Shut down the OCR worker processes and release the Tesseract handle"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self._api is not None:
+            self._api.End()
+            self._api = None
+    
+    async def extract_text_from_file(self, source: Union[bytes, str], filename: str) -> str:
+        """Extract text from uploaded file (PDF or image), given its content or a path on disk"""
         try:
             file_extension = os.path.splitext(filename.lower())[1]
             
             if file_extension == '.pdf':
-                return await self._extract_from_pdf(file_content)
+                return await self._extract_from_pdf(source)
             elif file_extension in ['.png', '.jpg', '.jpeg', '.tiff', '.bmp']:
-                return await self._extract_from_image(file_content)
+                return await self._extract_from_image(source)
             else:
                 raise ValueError(f"Unsupported file format: {file_extension}")
                 
@@ -30,87 +133,101 @@ class OCRService:
             logger.error(f"OCR extraction failed for {filename}: {str(e)}")
             raise
     
-    async def _extract_from_pdf(self, pdf_content: bytes) -> str:
+    async def _extract_from_pdf(self, pdf_source: Union[bytes, str]) -> str:
         """Extract text from PDF file"""
         try:
-            # Convert PDF to images
-            images = pdf2image.convert_from_bytes(
-                pdf_content,
-                dpi=300,
-                first_page=1,
-                last_page=5  # Limit to first 5 pages for performance
-            )
+            # Digital-born PDFs already carry their text; skip OCR entirely
+            embedded_text = await asyncio.to_thread(self._try_extract_embedded_text, pdf_source)
+            if embedded_text is not None:
+                logger.info("Using embedded PDF text layer")
+                return embedded_text
             
-            extracted_texts = []
-            for i, image in enumerate(images):
-                logger.info(f"Processing PDF page {i+1}")
-                text = pytesseract.image_to_string(
-                    image, 
-                    config=settings.OCR_CONFIG
-                )
-                if text.strip():
-                    extracted_texts.append(text)
+            # Convert PDF to images (grayscale: Tesseract only needs one channel)
+            images = await asyncio.to_thread(self._render_pdf_pages, pdf_source)
             
-            return "\n\n".join(extracted_texts)
+            # OCR all pages in parallel, one worker process per page
+            logger.info(f"Processing {len(images)} PDF pages")
+            loop = asyncio.get_running_loop()
+            pool = self._get_pool()
+            texts = await asyncio.gather(*(
+                loop.run_in_executor(pool, ocr_page, image)
+                for image in images
+            ))
+            
+            return "\n\n".join(text for text in texts if text.strip())
             
         except Exception as e:
             logger.error(f"PDF OCR failed: {str(e)}")
             raise
     
-    async def _extract_from_image(self, image_content: bytes) -> str:
+    def _render_pdf_pages(self, pdf_source: Union[bytes, str]) -> List[Image.Image]:
+        """Rasterize the first pages in-process with PDFium at settings.OCR_DPI"""
+        scale = settings.OCR_DPI / 72  # PDF user space is 72 units per inch
+        with _pdfium_lock:
+            pdf = pdfium.PdfDocument(pdf_source)
+            try:
+                # Grayscale PIL images share the bitmap's buffer; copy so they outlive the document
+                return [
+                    pdf[index].render(scale=scale, grayscale=True).to_pil().copy()
+                    for index in range(min(len(pdf), PDF_MAX_PAGES))
+                ]
+            finally:
+                pdf.close()
+    
+    def _try_extract_embedded_text(self, pdf_source: Union[bytes, str]) -> Optional[str]:
+        """Return the PDF's embedded text layer, or None if it has too little text"""
+        try:
+            with _pdfium_lock:
+                pdf = pdfium.PdfDocument(pdf_source)
+                try:
+                    texts = [
+                        pdf[index].get_textpage().get_text_range()
+                        for index in range(min(len(pdf), PDF_MAX_PAGES))
+                    ]
+                finally:
+                    pdf.close()
+        except Exception as e:
+            logger.warning(f"Could not read embedded PDF text, falling back to OCR: {str(e)}")
+            return None
+        
+        text = "\n\n".join(page_text for page_text in texts if page_text.strip())
+        if len(text.strip()) > MIN_EMBEDDED_TEXT_LENGTH:
+            return text
+        return None
+    
+    async def _extract_from_image(self, image_source: Union[bytes, str]) -> str:
         """Extract text from image file"""
         try:
-            # Open image from bytes
-            image = Image.open(io.BytesIO(image_content))
-            
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Extract text using Tesseract
-            text = pytesseract.image_to_string(
-                image, 
-                config=settings.OCR_CONFIG
-            )
-            
-            return text.strip()
-            
+            return await asyncio.to_thread(self._sync_extract_image, image_source)
         except Exception as e:
             logger.error(f"Image OCR failed: {str(e)}")
             raise
     
-    def preprocess_text(self, text: str) -> str:
-        """Clean and preprocess extracted text"""
-        if not text:
-            return ""
+    def _sync_extract_image(self, image_source: Union[bytes, str]) -> str:
+        """Blocking part of image OCR (runs in a worker thread)"""
+        # Open image from a path, or from bytes
+        image = Image.open(image_source if isinstance(image_source, str) else io.BytesIO(image_source))
         
-        # Basic text cleaning
-        lines = text.split('\n')
-        cleaned_lines = []
+        # Binarize outside the lock so concurrent requests only serialize on Tesseract itself
+        image = _preprocess(image)
         
-        for line in lines:
-            line = line.strip()
-            if len(line) > 2:  # Filter out very short lines
-                cleaned_lines.append(line)
+        # Extract text using Tesseract
+        with self._api_lock:
+            text = _recognize(self._get_api(), image)
         
-        return '\n'.join(cleaned_lines)
+        return text.strip()
+    
+    def preprocess_text(self, text: str) -> str:
+        """Clean and preprocess extracted text"""
+        return clean_ocr_text(text)
     
     async def get_text_confidence(self, image_content: bytes) -> dict:
         """Get OCR confidence scores"""
         try:
-            image = Image.open(io.BytesIO(image_content))
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
-            
-            # Get detailed OCR data
-            data = pytesseract.image_to_data(
-                image, 
-                output_type=pytesseract.Output.DICT,
-                config=settings.OCR_CONFIG
-            )
+            word_confidences = await asyncio.to_thread(self._sync_word_confidences, image_content)
             
             # Calculate confidence metrics
-            confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
+            confidences = [conf for conf in word_confidences if conf > 0]
             avg_confidence = sum(confidences) / len(confidences) if confidences else 0
             
             return {
@@ -121,4 +238,15 @@ class OCRService:
             
         except Exception as e:
             logger.error(f"Confidence calculation failed: {str(e)}")
-            return {"average_confidence": 0, "word_count": 0, "low_confidence_words": 0}
\ No newline at end of file
+            return {"average_confidence": 0, "word_count": 0, "low_confidence_words": 0}
+    
+    def _sync_word_confidences(self, image_content: bytes) -> List[int]:
+        """Blocking part of the confidence calculation (runs in a worker thread)"""
+        image = Image.open(io.BytesIO(image_content))
+        image = _preprocess(image)
+        
+        # Get per-word confidences
+        with self._api_lock:
+            api = self._get_api()
+            api.SetImage(image)
+            return api.AllWordConfidences()
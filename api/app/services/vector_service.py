@@ -1,57 +1,180 @@
 # api/app/services/vector_service.py
 import marqo
-from typing import List, Dict, Any
+import marqo._httprequests
+import httpx
+import orjson
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from typing import List, Dict, Any, Optional
 from loguru import logger
-import uuid
+from hashlib import blake2b
+import re
 import time
 from ..core.config import settings
 import asyncio
+import threading
+
+# Connection pool sizes for Marqo; requests from worker threads and the event loop run concurrently
+POOL_CONNECTIONS = 32
+POOL_MAXSIZE = 64
+
+# marqo-python sends everything through one module-level requests.Session; widen its
+# default 10-connection pool so concurrent to_thread calls keep their keep-alive sockets
+_marqo_adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+marqo._httprequests.session.mount("http://", _marqo_adapter)
+marqo._httprequests.session.mount("https://", _marqo_adapter)
+
+# Client-side embedded text is split into sentences and stored as one custom vector field
+# per chunk ("content_0", "content_1", ...), mirroring Marqo's own sentence chunking
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+CHUNK_FIELD_PREFIX = "content_"
+
+def _split_text(text: str) -> List[str]:
+    """Split text into chunks of EMBEDDING_SPLIT_LENGTH sentences, at most EMBEDDING_MAX_CHUNKS"""
+    sentences = [s for s in _SENTENCE_RE.split(text) if s.strip()]
+    step = settings.EMBEDDING_SPLIT_LENGTH
+    chunks = [" ".join(sentences[i:i + step]) for i in range(0, len(sentences), step)]
+    return chunks[:settings.EMBEDDING_MAX_CHUNKS] or [text]
+
+def _content_id(text: str) -> str:
+    """Stable document ID from a 64-bit BLAKE2b digest of the text"""
+    return f"doc_{blake2b(text.encode('utf-8'), digest_size=8).hexdigest()}"
 
 class VectorService:
-    def __init__(self):
+    def __init__(self, client_side_embeddings: Optional[bool] = None):
         self.client = marqo.Client(url=settings.MARQO_URL)
         self.index_name = settings.MARQO_INDEX_NAME
-        self._index_ready = False
+        # Set once the index is known to be ready; waiters share a single probe
+        self._ready_event = asyncio.Event()
+        # Index handle, bound once the index is known to be ready
+        self._index = None
+        # Serializes the cold-start probe so concurrent requests don't all hit Marqo
+        self._probe_lock = asyncio.Lock()
+        # Document type distribution changes slowly; cleared on every add/delete
+        self._distribution_cache = TTLCache(maxsize=1, ttl=settings.STATS_CACHE_TTL)
+        # Client-side embedding model, loaded on first use
+        self._embedder = None
+        if client_side_embeddings is None:
+            client_side_embeddings = settings.CLIENT_SIDE_EMBEDDINGS
+        self._embedder_failed = not client_side_embeddings
+        self._embedder_lock = threading.Lock()
+        # Pooled keep-alive client for the search hot path, bypassing the blocking marqo client
+        self._http = httpx.AsyncClient(
+            base_url=settings.MARQO_URL,
+            timeout=settings.MARQO_TIMEOUT,
+            limits=httpx.Limits(max_connections=POOL_MAXSIZE, max_keepalive_connections=POOL_CONNECTIONS)
+        )
         # Don't block startup - initialize index asynchronously
         self._ensure_index_exists()
     
     def _ensure_index_exists(self):
         """Create index if it doesn't exist - non-blocking"""
         try:
-            # Quick check if Marqo is available
-            self.client.get_indexes()
-            self._index_ready = True
-            logger.info(f"Marqo connection successful, index {self.index_name} ready")
+            # Quick check if Marqo is available; only an existing index counts as ready,
+            # otherwise the first request creates it via _ensure_index_exists_async
+            indexes = self.client.get_indexes()
+            if self.index_name in [idx["indexName"] for idx in indexes.get("results", [])]:
+                self._mark_index_ready(self.client.index(self.index_name))
+                logger.info(f"Marqo connection successful, index {self.index_name} ready")
+            else:
+                logger.info(f"Marqo connection successful, index {self.index_name} will be created on first use")
         except Exception as e:
             logger.warning(f"Marqo not ready during startup: {str(e)}")
             logger.info("API will continue without vector database functionality")
-            self._index_ready = False
+    
+    @property
+    def index_ready(self) -> bool:
+        """Whether the vector index is known to be ready"""
+        return self._ready_event.is_set()
+    
+    def _mark_index_ready(self, index):
+        """Record that the index is usable and cache its handle (event loop thread only)"""
+        self._index = index
+        self._ready_event.set()
+    
+    def _create_index_if_missing(self):
+        """Check if the index exists and create it if not, returning its handle (blocking)"""
+        indexes = self.client.get_indexes()
+        if self.index_name not in [idx["indexName"] for idx in indexes.get("results", [])]:
+            # Create index with a smaller model that requires less memory
+            self.client.create_index(
+                self.index_name, 
+                model="hf/all_datasets_v4_MiniLM-L6"
+            )
+            logger.info(f"Created vector index: {self.index_name}")
+        else:
+            logger.info(f"Vector index already exists: {self.index_name}")
+        return self.client.index(self.index_name)
     
     async def _ensure_index_exists_async(self) -> bool:
         """Ensure the vector index exists, creating it if necessary."""
-        try:
-            if not self._index_ready:
-                # Check if index exists
-                try:
-                    indexes = self.client.get_indexes()
-                    if self.index_name not in [idx["indexName"] for idx in indexes.get("results", [])]:
-                        # Create index with a smaller model that requires less memory
-                        self.client.create_index(
-                            self.index_name, 
-                            model="hf/all_datasets_v4_MiniLM-L6"
-                        )
-                        logger.info(f"Created vector index: {self.index_name}")
-                    else:
-                        logger.info(f"Vector index already exists: {self.index_name}")
-                    self._index_ready = True
-                    return True
-                except Exception as e:
-                    logger.error(f"Error checking/creating vector index: {str(e)}")
-                    return False
+        if self._ready_event.is_set():
             return True
+        
+        async with self._probe_lock:
+            # Another request may have finished the probe while we waited
+            if self._ready_event.is_set():
+                return True
+            try:
+                self._mark_index_ready(await asyncio.to_thread(self._create_index_if_missing))
+                return True
+            except Exception as e:
+                logger.error(f"Error checking/creating vector index: {str(e)}")
+                return False
+    
+    def _get_embedder(self):
+        """Lazily load the client-side embedding model; None if it is unavailable"""
+        with self._embedder_lock:
+            if self._embedder is None and not self._embedder_failed:
+                self._load_embedder()
+        return self._embedder
+    
+    def _load_embedder(self):
+        """Load the SentenceTransformer model, on the GPU in half precision when available"""
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            embedder = SentenceTransformer(settings.EMBEDDING_MODEL, device=device)
+            if device == "cuda":
+                embedder.half()
+            self._embedder = embedder
+            logger.info(f"Loaded embedding model {settings.EMBEDDING_MODEL} on {device}")
         except Exception as e:
-            logger.error(f"Error in _ensure_index_exists_async: {str(e)}")
-            return False
+            logger.warning(f"Client-side embeddings unavailable, Marqo will embed documents: {str(e)}")
+            self._embedder_failed = True
+    
+    def _embed_documents(self, prepared_docs: List[Dict[str, Any]]) -> Optional[tuple]:
+        """Attach precomputed chunk vectors to each document (blocking). Returns the documents
+        and their chunk field names, or None to let Marqo embed"""
+        embedder = self._get_embedder()
+        if embedder is None:
+            return None
+        
+        # Each chunk is embedded separately, since the model only reads its first 128 tokens
+        doc_chunks = [_split_text(doc["content"]) for doc in prepared_docs]
+        try:
+            vectors = embedder.encode(
+                [chunk for chunks in doc_chunks for chunk in chunks],
+                batch_size=settings.EMBEDDING_BATCH_SIZE,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )
+        except Exception as e:
+            logger.warning(f"Client-side embedding failed, Marqo will embed documents: {str(e)}")
+            return None
+        
+        embedded_docs = []
+        offset = 0
+        for doc, chunks in zip(prepared_docs, doc_chunks):
+            embedded = dict(doc)
+            for i, chunk in enumerate(chunks):
+                embedded[f"{CHUNK_FIELD_PREFIX}{i}"] = {"content": chunk, "vector": vectors[offset + i].tolist()}
+            offset += len(chunks)
+            embedded_docs.append(embedded)
+        
+        fields = [f"{CHUNK_FIELD_PREFIX}{i}" for i in range(max(map(len, doc_chunks)))]
+        return embedded_docs, fields
     
     async def add_documents(self, documents: List[Dict[str, Any]]) -> bool:
         """Add documents to the vector database"""
@@ -67,29 +190,41 @@ class VectorService:
 
             logger.info(f"Preparing to add {len(documents)} documents to index")
 
-            # Prepare documents for indexing, ensuring stable and unique IDs
-            prepared_docs = []
-            for doc in documents:
-                # If an _id is provided in the doc, use it. Otherwise, generate one.
-                # This makes the operation idempotent if the caller provides stable IDs.
-                doc_id = doc.get("_id") or f"doc_{uuid.uuid4()}"
-
-                prepared_doc = {
-                    "_id": doc_id,
+            # Prepare documents for indexing, ensuring stable and unique IDs.
+            # If an _id is provided in the doc, use it; otherwise derive one from the content,
+            # so re-adding the same text updates the existing document instead of duplicating it.
+            prepared_docs = [
+                {
+                    "_id": doc.get("_id") or _content_id(doc.get("text", "")),
                     "content": doc.get("text", ""),
                     "document_type": doc.get("document_type", "unknown"),
                     "filename": doc.get("filename", "unknown_file"),
                     "metadata": doc.get("metadata", {})
                 }
-                prepared_docs.append(prepared_doc)
+                for doc in documents
+            ]
+
+            # Embed locally in large batches; each chunk becomes a custom vector field and
+            # "content" is kept as plain text. Otherwise Marqo chunks and embeds "content".
+            embedded = await asyncio.to_thread(self._embed_documents, prepared_docs)
+            if embedded is not None:
+                prepared_docs, tensor_fields = embedded
+                mappings = {field: {"type": "custom_vector"} for field in tensor_fields}
+            else:
+                tensor_fields = ["content"]
+                mappings = None
 
-            # Add documents to Marqo
-            response = self.client.index(self.index_name).add_documents(
+            # Add documents to Marqo; the client is synchronous, so keep it off the event loop
+            response = await asyncio.to_thread(
+                self._index.add_documents,
                 prepared_docs,
-                tensor_fields=["content"],
+                tensor_fields=tensor_fields,
+                mappings=mappings,
                 device="cpu" # Specify device for broader compatibility
             )
 
+            self._distribution_cache.clear()
+            
             if response.get("errors"):
                 logger.error(f"Errors occurred during indexing: {response['errors']}")
                 # Optionally raise an exception here
@@ -118,12 +253,19 @@ class VectorService:
                 
             logger.info(f"Searching for similar documents with query length: {len(query_text)}")
             
-            # Perform semantic search
-            results = self.client.index(self.index_name).search(
-                q=query_text,
-                limit=limit,
-                searchable_attributes=["content"]
+            # Perform semantic search (same request the marqo client would send, but non-blocking)
+            response = await self._http.post(
+                f"/indexes/{self.index_name}/search",
+                content=orjson.dumps({
+                    "q": query_text,
+                    "limit": limit,
+                    # All tensor fields: "content", or the content_N chunks when embedded client-side
+                    "searchMethod": "TENSOR"
+                }),
+                headers={"Content-Type": "application/json"}
             )
+            response.raise_for_status()
+            results = orjson.loads(response.content)
             
             # Filter and format results
             filtered_results = []
@@ -147,17 +289,22 @@ class VectorService:
     
     async def get_document_type_distribution(self) -> Dict[str, int]:
         """Get distribution of document types in the database"""
+        type_counts = self._distribution_cache.get("distribution")
+        if type_counts is not None:
+            return type_counts
+        
         try:
             # Ensure index is ready
             if not await self._ensure_index_exists_async():
                 logger.warning("Vector database not available - returning empty distribution")
                 return {}
                 
-            # Search all documents
-            results = self.client.index(self.index_name).search(
+            # Marqo has no count/group-by API; fetch only the type field of each hit
+            results = await asyncio.to_thread(
+                self._index.search,
                 q="*",
                 limit=1000,
-                searchable_attributes=["content"]
+                attributes_to_retrieve=["document_type"]
             )
             
             # Count document types
@@ -166,6 +313,7 @@ class VectorService:
                 doc_type = hit.get("document_type", "unknown")
                 type_counts[doc_type] = type_counts.get(doc_type, 0) + 1
             
+            self._distribution_cache["distribution"] = type_counts
             return type_counts
             
         except Exception as e:
@@ -176,7 +324,14 @@ class VectorService:
         """Delete the entire index (for testing/reset purposes)"""
         try:
             self.client.delete_index(self.index_name)
+            self._ready_event.clear()
+            self._index = None
+            self._distribution_cache.clear()
             logger.info(f"Index {self.index_name} deleted successfully")
         except Exception as e:
             logger.error(f"Error deleting index: {str(e)}")
             raise
+    
+    async def close(self):
+        """Close the pooled HTTP connections to Marqo"""
+        await self._http.aclose()
@@ -1,16 +1,28 @@
+import asyncio
 import os
+import shutil
 import uuid
+from functools import lru_cache
 from typing import Optional
 from fastapi import UploadFile
 from loguru import logger
+from ..core.config import ALLOWED_EXT_SET
 
-def validate_file_extension(filename: str, allowed_extensions: list) -> bool:
+# Copy uploads to disk in 1 MiB chunks so memory use does not grow with file size
+COPY_BUFFER_SIZE = 1024 * 1024
+
+@lru_cache(maxsize=1024)
+def _ext_of(filename: str) -> str:
+    """Lower-cased extension including the dot, or "" if there is none"""
+    dot = filename.rfind('.')
+    return filename[dot:].lower() if dot != -1 else ''
+
+def validate_file_extension(filename: str, allowed_extensions: frozenset = ALLOWED_EXT_SET) -> bool:
     """Validate if file extension is allowed"""
     if not filename:
         return False
     
-    file_extension = os.path.splitext(filename.lower())[1]
-    return file_extension in allowed_extensions
+    return _ext_of(filename) in allowed_extensions
 
 def validate_file_size(file_content: bytes, max_size: int) -> bool:
     """Validate if file size is within limits"""
@@ -18,18 +30,23 @@ def validate_file_size(file_content: bytes, max_size: int) -> bool:
 
 def generate_unique_filename(original_filename: str) -> str:
     """Generate a unique filename"""
-    name, ext = os.path.splitext(original_filename)
+    # Drop any client-supplied directory components
+    name, ext = os.path.splitext(os.path.basename(original_filename))
     unique_id = str(uuid.uuid4())[:8]
     return f"{name}_{unique_id}{ext}"
 
-def save_uploaded_file(file_content: bytes, filename: str, upload_dir: str) -> str:
-    """Save uploaded file to disk"""
+def _copy_upload(upload: UploadFile, file_path: str) -> None:
+    upload.file.seek(0)
+    with open(file_path, 'wb', buffering=COPY_BUFFER_SIZE) as f:
+        shutil.copyfileobj(upload.file, f, length=COPY_BUFFER_SIZE)
+
+async def save_uploaded_file(upload: UploadFile, filename: str, upload_dir: str) -> str:
+    """Stream an uploaded file to disk without blocking the event loop"""
     try:
         os.makedirs(upload_dir, exist_ok=True)
         file_path = os.path.join(upload_dir, filename)
         
-        with open(file_path, 'wb') as f:
-            f.write(file_content)
+        await asyncio.to_thread(_copy_upload, upload, file_path)
         
         logger.info(f"File saved: {file_path}")
         return file_path
@@ -0,0 +1,40 @@
+# api/app/utils/http_utils.py
+import zlib
+from typing import Callable
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
+from ..core.config import settings
+
+def gunzip_body(data: bytes, max_size: int) -> bytes:
+    """Decompress a gzip request body, refusing bodies that inflate past max_size"""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        body = decompressor.decompress(data, max_size)
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Invalid gzip request body")
+    
+    if decompressor.unconsumed_tail:
+        raise HTTPException(status_code=413, detail="Decompressed request body too large")
+    return body
+
+class GzipRequest(Request):
+    """Request whose body is decompressed when sent with Content-Encoding: gzip"""
+    
+    async def body(self) -> bytes:
+        if not hasattr(self, "_body"):
+            body = await super().body()
+            if "gzip" in self.headers.get("content-encoding", ""):
+                body = gunzip_body(body, settings.MAX_FILE_SIZE)
+            self._body = body
+        return self._body
+
+class GzipRoute(APIRoute):
+    """Route that hands its endpoint a GzipRequest"""
+    
+    def get_route_handler(self) -> Callable:
+        original_handler = super().get_route_handler()
+        
+        async def handler(request: Request) -> Response:
+            return await original_handler(GzipRequest(request.scope, request.receive))
+        
+        return handler
@@ -1,82 +1,78 @@
 import re
+from collections import Counter
 from typing import List, Dict, Any
 from datetime import datetime
 
+# Patterns and word lists are compiled/built once at import
+_WHITESPACE_RE = re.compile(r'\s+')
+_NONWORD_RE = re.compile(r'[^\w\s\.\,\-\:\;\!\?\(\)\[\]\{\}]')
+_WORD_RE = re.compile(r'\b\w+\b')
+
+# YYYY-MM-DD, or MM/DD/YYYY, MM-DD-YYYY, MM.DD.YYYY (same separator twice)
+_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}|\d{1,2}([/.\-])\d{1,2}\1\d{2,4}')
+
+# Kept as separate patterns: amounts may legitimately overlap ("$5 USD")
+_AMOUNT_PATTERNS = (
+    re.compile(r'\$\d+\.?\d*'),              # $123.45
+    re.compile(r'\d+\.?\d*\s*(?:USD|EUR|GBP)', re.IGNORECASE), # 123.45 USD
+    re.compile(r'\d+\.?\d*\s*(?:dollars?|euros?|pounds?)', re.IGNORECASE), # 123.45 dollars
+)
+
+_EMAIL_RE = re.compile(r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b')
+
+# Kept as separate patterns: a number may match both ("(555) 123-4567" also
+# yields "123-4567" as international), and callers rely on getting both
+_PHONE_PATTERNS = (
+    re.compile(r'\+?1?\s*\(?[0-9]{3}\)?[\s\-]?[0-9]{3}[\s\-]?[0-9]{4}'),  # US format
+    re.compile(r'\+?[0-9]{1,4}[\s\-]?[0-9]{1,4}[\s\-]?[0-9]{1,4}[\s\-]?[0-9]{1,4}'),  # International
+)
+
+STOP_WORDS = frozenset({'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by'})
+COMMON_WORDS = STOP_WORDS | frozenset({'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'may', 'might', 'must', 'can'})
+
 def clean_text(text: str) -> str:
     """Clean and normalize text"""
     if not text:
         return ""
     
     # Remove extra whitespace
-    text = re.sub(r'\s+', ' ', text)
+    text = _WHITESPACE_RE.sub(' ', text)
     
     # Remove special characters but keep basic punctuation
-    text = re.sub(r'[^\w\s\.\,\-\:\;\!\?\(\)\[\]\{\}]', '', text)
+    text = _NONWORD_RE.sub('', text)
     
     return text.strip()
 
 def extract_dates(text: str) -> List[str]:
     """Extract date patterns from text"""
-    date_patterns = [
-        r'\d{1,2}/\d{1,2}/\d{2,4}',  # MM/DD/YYYY or MM/DD/YY
-        r'\d{4}-\d{2}-\d{2}',        # YYYY-MM-DD
-        r'\d{1,2}-\d{1,2}-\d{2,4}',  # MM-DD-YYYY
-        r'\d{1,2}\.\d{1,2}\.\d{2,4}' # MM.DD.YYYY
-    ]
-    
-    dates = []
-    for pattern in date_patterns:
-        matches = re.findall(pattern, text)
-        dates.extend(matches)
-    
-    return list(set(dates))  # Remove duplicates
+    return list({m.group(0) for m in _DATE_RE.finditer(text)})
 
 def extract_amounts(text: str) -> List[str]:
     """Extract monetary amounts from text"""
-    amount_patterns = [
-        r'\$\d+\.?\d*',              # $123.45
-        r'\d+\.?\d*\s*(?:USD|EUR|GBP)', # 123.45 USD
-        r'\d+\.?\d*\s*(?:dollars?|euros?|pounds?)', # 123.45 dollars
-    ]
-    
     amounts = []
-    for pattern in amount_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        amounts.extend(matches)
+    for pattern in _AMOUNT_PATTERNS:
+        amounts.extend(pattern.findall(text))
     
     return list(set(amounts))
 
 def extract_emails(text: str) -> List[str]:
     """Extract email addresses from text"""
-    email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-    return re.findall(email_pattern, text)
+    return _EMAIL_RE.findall(text)
 
 def extract_phone_numbers(text: str) -> List[str]:
     """Extract phone numbers from text"""
-    phone_patterns = [
-        r'\+?1?\s*\(?[0-9]{3}\)?[\s\-]?[0-9]{3}[\s\-]?[0-9]{4}',  # US format
-        r'\+?[0-9]{1,4}[\s\-]?[0-9]{1,4}[\s\-]?[0-9]{1,4}[\s\-]?[0-9]{1,4}',  # International
-    ]
-    
-    phones = []
-    for pattern in phone_patterns:
-        matches = re.findall(pattern, text)
-        phones.extend(matches)
-    
-    return list(set(phones))
+    return list({m.group(0) for pattern in _PHONE_PATTERNS for m in pattern.finditer(text)})
 
 def calculate_text_similarity(text1: str, text2: str) -> float:
     """Calculate simple text similarity using word overlap"""
-    words1 = set(text1.lower().split())
-    words2 = set(text2.lower().split())
+    words1 = frozenset(text1.lower().split())
+    words2 = frozenset(text2.lower().split())
     
     if not words1 or not words2:
         return 0.0
     
-    intersection = words1.intersection(words2)
-    union = words1.union(words2)
-    
-    return len(intersection) / len(union)
+    intersection = len(words1 & words2)
+    return intersection / (len(words1) + len(words2) - intersection)
 
 def normalize_text_for_search(text: str) -> str:
     """Normalize text for better search results"""
@@ -84,26 +80,18 @@ def normalize_text_for_search(text: str) -> str:
     text = text.lower()
     
     # Remove common stop words
-    stop_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by'}
     words = text.split()
-    filtered_words = [word for word in words if word not in stop_words]
+    filtered_words = [word for word in words if word not in STOP_WORDS]
     
     return ' '.join(filtered_words)
 
 def extract_keywords(text: str, max_keywords: int = 10) -> List[str]:
     """Extract important keywords from text"""
     # Simple keyword extraction based on frequency
-    words = re.findall(r'\b\w+\b', text.lower())
-    
-    # Remove common words
-    common_words = {'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should', 'may', 'might', 'must', 'can'}
-    filtered_words = [word for word in words if word not in common_words and len(word) > 2]
+    words = _WORD_RE.findall(text.lower())
     
-    # Count frequency
-    word_count = {}
-    for word in filtered_words:
-        word_count[word] = word_count.get(word, 0) + 1
+    # Count frequency, skipping common words
+    word_count = Counter(word for word in words if len(word) > 2 and word not in COMMON_WORDS)
     
-    # Sort by frequency and return top keywords
-    sorted_words = sorted(word_count.items(), key=lambda x: x[1], reverse=True)
-    return [word for word, count in sorted_words[:max_keywords]]
+    # Return top keywords by frequency
+    return [word for word, count in word_count.most_common(max_keywords)]
@@ -1,14 +1,20 @@
 # api/main.py
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import JSONResponse
 import uvicorn
 from contextlib import asynccontextmanager
 from loguru import logger
+from types import SimpleNamespace
 import sys
 
 from app.core.config import settings
 from app.routes.document_router import router as document_router
+from app.services.ocr_service import OCRService
+from app.services.classification_service import DocumentClassificationService
+from app.services.extraction_service import EntityExtractionService
+from app.services.vector_service import VectorService
 from app.core.exceptions import DocumentProcessingException
 
 # Configure logging
@@ -22,7 +28,14 @@ async def lifespan(app: FastAPI):
     
     # Startup
     try:
-        # Initialize services here if needed
+        # One instance of each service, shared by all requests
+        vector_service = VectorService()
+        app.state.services = SimpleNamespace(
+            ocr=OCRService(),
+            vector=vector_service,
+            classification=DocumentClassificationService(vector_service=vector_service),
+            extraction=EntityExtractionService()
+        )
         logger.info("API startup completed successfully")
         yield
     except Exception as e:
@@ -30,6 +43,10 @@ async def lifespan(app: FastAPI):
         raise
     finally:
         # Cleanup
+        services = getattr(app.state, "services", None)
+        if services is not None:
+            services.ocr.close()
+            await services.vector.close()
         logger.info("API shutdown completed")
 
 # Create FastAPI application
@@ -49,6 +66,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress responses for clients that accept gzip; gzip request bodies are
+# decompressed by the routers' GzipRoute
+app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MIN_SIZE)
+
 # Include routers
 app.include_router(document_router, prefix="/api/v1", tags=["documents"])
 
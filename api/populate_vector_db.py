@@ -1,15 +1,20 @@
 import asyncio
+import mmap
+import multiprocessing
 import os
+import random
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from PIL import Image
 from loguru import logger
 from tqdm.asyncio import tqdm
 
 # Adjust imports based on whether we're running inside Docker or locally
 if os.path.exists('/app'):
     # We're inside Docker container
-    from app.services.ocr_service import OCRService
+    from app.services.ocr_service import init_ocr_worker, ocr_page, clean_ocr_text
     from app.services.vector_service import VectorService
     from app.core.config import settings
     
@@ -21,22 +26,26 @@ else:
     project_root = Path(__file__).resolve().parents[1]
     sys.path.insert(0, str(project_root))
     
-    from api.app.services.ocr_service import OCRService
+    from api.app.services.ocr_service import init_ocr_worker, ocr_page, clean_ocr_text
     from api.app.services.vector_service import VectorService
     from api.app.core.config import settings
 
 # --- Constants ---
 # Use the original archive/docs-sm path
 DATA_DIR = project_root / "archive" / "docs-sm"
-BATCH_SIZE = 32
+BATCH_SIZE = 128
+# Maximum number of batches being indexed by Marqo at the same time
+MAX_INFLIGHT = 4
 DELETE_EXISTING_INDEX = True
 MAX_RETRIES = 10
+IMAGE_EXTENSIONS = frozenset({"jpg", "jpeg", "png", "bmp", "tiff"})
 RETRY_DELAY = 5
 
 async def wait_for_marqo(vector_service, max_retries=MAX_RETRIES, retry_delay=RETRY_DELAY):
     """Wait for Marqo to be available with retries"""
     logger.info(f"Waiting for Marqo to be available at {settings.MARQO_URL}...")
     
+    wait_time = retry_delay
     for attempt in range(1, max_retries + 1):
         try:
             # Try to connect and check if index exists
@@ -49,9 +58,9 @@ async def wait_for_marqo(vector_service, max_retries=MAX_RETRIES, retry_delay=RE
             logger.warning(f"Attempt {attempt}/{max_retries}: Failed to connect to Marqo: {str(e)}")
         
         if attempt < max_retries:
-            wait_time = retry_delay * (2 ** (attempt - 1))  # Exponential backoff
-            wait_time = min(wait_time, 60)  # Cap at 60 seconds
-            logger.info(f"Retrying in {wait_time} seconds...")
+            # Decorrelated jitter, so restarted replicas don't retry in lockstep
+            wait_time = min(60, random.uniform(retry_delay, wait_time * 3))  # Cap at 60 seconds
+            logger.info(f"Retrying in {wait_time:.1f} seconds...")
             await asyncio.sleep(wait_time)
         else:
             logger.error("Failed to connect to Marqo after all retries")
@@ -75,8 +84,8 @@ async def populate_database():
         return
 
     # --- Initialize Services ---
-    ocr_service = OCRService()
-    vector_service = VectorService()
+    # This script is the dedicated indexing worker, so it embeds documents itself
+    vector_service = VectorService(client_side_embeddings=True)
     
     # Wait for Marqo to be available
     if not await wait_for_marqo(vector_service):
@@ -88,47 +97,64 @@ async def populate_database():
         try:
             logger.warning(f"Attempting to delete existing index '{settings.MARQO_INDEX_NAME}'...")
             await vector_service.delete_index()
-            # Re-initialize the service to ensure the index is re-created on demand
-            vector_service = VectorService()
+            # Re-initialize the service to ensure the index is re-created on demand,
+            # closing the old instance's HTTP client first
+            await vector_service.close()
+            vector_service = VectorService(client_side_embeddings=True)
             logger.success("Index deleted and services re-initialized.")
         except Exception as e:
             logger.warning(f"Could not delete index (it might not exist yet). Error: {e}")
 
     # --- Gather Files ---
     logger.info("Scanning for document files...")
-    all_files = list(DATA_DIR.glob("**/*.*"))
-    image_files = [
-        f for f in all_files if f.suffix.lower() in {".jpg", ".jpeg", ".png", ".bmp", ".tiff"}
-    ]
+    image_files = list(iter_images(str(DATA_DIR)))
     logger.info(f"Found {len(image_files)} total image files to process.")
 
     # --- Process and Index Files ---
     documents_to_add = []
     total_processed = 0
     total_failed = 0
-
-    # Using tqdm.as_completed for progress bar on async tasks
-    tasks = [process_file(file, ocr_service) for file in image_files]
-    
-    for future in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Processing Documents"):
-        try:
-            doc = await future
-            if doc:
-                documents_to_add.append(doc)
-                if len(documents_to_add) >= BATCH_SIZE:
-                    await index_batch(vector_service, documents_to_add)
-                    total_processed += len(documents_to_add)
-                    documents_to_add = []
-            else:
+    # Batches are indexed in the background while OCR continues
+    index_semaphore = asyncio.Semaphore(MAX_INFLIGHT)
+    index_tasks = []
+
+    # OCR runs in a pool of single-threaded Tesseract worker processes, one per core;
+    # spawned (not forked) so OMP_THREAD_LIMIT is set before Tesseract loads
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(
+        max_workers=os.cpu_count() or 1,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_ocr_worker
+    ) as ocr_pool:
+        # Using tqdm.as_completed for progress bar on async tasks
+        tasks = [loop.run_in_executor(ocr_pool, process_file, file) for file in image_files]
+        
+        for future in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Processing Documents"):
+            try:
+                doc = await future
+                if doc:
+                    documents_to_add.append(doc)
+                    if len(documents_to_add) >= BATCH_SIZE:
+                        index_tasks.append(asyncio.create_task(
+                            index_batch_limited(index_semaphore, vector_service, documents_to_add)
+                        ))
+                        documents_to_add = []
+                else:
+                    total_failed += 1
+            except Exception as e:
+                logger.error(f"Error in main processing loop: {e}")
                 total_failed += 1
-        except Exception as e:
-            logger.error(f"Error in main processing loop: {e}")
-            total_failed += 1
-
+    
     # Index any remaining documents
     if documents_to_add:
-        await index_batch(vector_service, documents_to_add)
-        total_processed += len(documents_to_add)
+        index_tasks.append(asyncio.create_task(
+            index_batch_limited(index_semaphore, vector_service, documents_to_add)
+        ))
+    
+    for indexed, batch_size in await asyncio.gather(*index_tasks):
+        total_processed += indexed
+        total_failed += batch_size - indexed
+    await vector_service.close()
 
     # --- Final Summary ---
     logger.success("--- Vector Database Population Completed ---")
@@ -136,19 +162,34 @@ async def populate_database():
     logger.info(f"Total documents failed to process: {total_failed}")
 
 
-async def process_file(image_path: Path, ocr_service: OCRService) -> dict | None:
+def iter_images(root: str):
+    """
+    Yields the paths of all image files under root, filtering during traversal.
+    """
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.rpartition(".")[2].lower() in IMAGE_EXTENSIONS and entry.is_file():
+                    yield entry.path
+
+def process_file(path: str) -> dict | None:
     """
     Reads a file, extracts text using OCR, and returns a document dictionary.
+    Runs in an OCR pool worker process.
     """
+    image_path = Path(path)
     try:
         document_type = image_path.parent.name
-        with open(image_path, "rb") as f:
-            file_content = f.read()
-
-        text = await ocr_service.extract_text_from_file(file_content, image_path.name)
+        # Decode straight from the page cache through a read-only mapping
+        with open(image_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with Image.open(mm) as image:
+                text = ocr_page(image)
 
         if text and text.strip():
-            clean_text = ocr_service.preprocess_text(text)
+            clean_text = clean_ocr_text(text)
             return {
                 # Use a sanitized and unique filename for the _id
                 "_id": f"{document_type}_{image_path.name}".replace(" ", "_").replace("/", "_"),
@@ -173,13 +214,26 @@ async def index_batch(vector_service: VectorService, batch: list):
         # Note: We are now passing the '_id' field directly in the document.
         # This requires the VectorService to be adjusted to use it.
         # If not adjusted, Marqo will generate its own IDs.
-        await vector_service.add_documents(batch)
+        # add_documents logs its own errors and reports failure by returning False
+        if not await vector_service.add_documents(batch):
+            raise RuntimeError(f"Marqo rejected batch of {len(batch)} documents")
         logger.info(f"Successfully indexed batch of {len(batch)} documents.")
     except Exception as e:
         logger.error(f"Failed to index batch: {e}")
-        # Optionally, re-raise or handle failed batches
+        # Re-raise so the caller counts the batch as failed
         raise
 
+async def index_batch_limited(semaphore: asyncio.Semaphore, vector_service: VectorService, batch: list) -> tuple:
+    """
+    Indexes a batch once a slot is free. Returns (documents indexed, batch size).
+    """
+    async with semaphore:
+        try:
+            await index_batch(vector_service, batch)
+            return len(batch), len(batch)
+        except Exception:
+            return 0, len(batch)
+
 if __name__ == "__main__":
     # Configure logging for the script
     logger.remove()
@@ -1,22 +1,114 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+import asyncio
+import aiohttp
+import concurrent.futures
+import httpx
+import orjson
 import os
+import threading
 from config import API_URL
 
+# Maximum number of batch uploads in flight at once
+BATCH_CONCURRENCY = 8
+# Query parameters for /extract_entities, built once instead of per click
+PARAMS_RAW_TEXT = {"include_raw_text": "true"}
+PARAMS_NO_RAW_TEXT = {"include_raw_text": "false"}
+# Seconds to wait for a single upload (OCR + LLM extraction) to finish
+UPLOAD_TIMEOUT = 120
+
 st.set_page_config(page_title="Document Understanding UI", layout="wide")
 st.title("📄 Intelligent Document Understanding")
 
+def _make_session():
+    """HTTP session with keep-alive connection pooling; idempotent requests are retried"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=Retry(total=3, backoff_factor=0.2))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# Kept in session state so Streamlit reruns reuse the same pooled connections
+if "http" not in st.session_state:
+    st.session_state.http = _make_session()
+http = st.session_state.http
+
+# One background event loop and async client per process, shared by every session,
+# so sessions do not each leave a thread and a connection pool behind. Uploads run
+# on that loop and the script thread only waits on the resulting future.
+@st.cache_resource
+def _async_runtime():
+    """Start the shared event loop on a daemon thread and create its httpx client"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    client = httpx.AsyncClient(
+        timeout=UPLOAD_TIMEOUT,
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=8)
+    )
+    return loop, client
+
+upload_loop, upload_client = _async_runtime()
+
+# Document types are static metadata; cache them across reruns. Failures raise,
+# so they are never cached.
+@st.cache_data(ttl=300, show_spinner=False)
+def fetch_document_types():
+    resp = http.get(f"{API_URL}/types")
+    resp.raise_for_status()
+    data = orjson.loads(resp.content)
+    return data.get("supported_types", []), data.get("document_types", {})
+
 # Helper to get document types and fields
 def get_document_types():
     try:
-        resp = requests.get(f"{API_URL}/types")
-        resp.raise_for_status()
-        data = resp.json()
-        return data.get("supported_types", []), data.get("document_types", {})
-    except Exception as e:
+        return fetch_document_types()
+    except (requests.RequestException, orjson.JSONDecodeError) as e:
         st.error(f"Failed to fetch document types: {e}")
         return [], {}
 
+async def _upload_one(session, sem, payload):
+    name, data, content_type = payload
+    async with sem:
+        # Every attempt builds its own form from the pre-read bytes
+        form = aiohttp.FormData()
+        form.add_field("file", data, filename=name, content_type=content_type)
+        async with session.post(f"{API_URL}/extract_entities", data=form) as resp:
+            resp.raise_for_status()
+            return await resp.json(loads=orjson.loads)
+
+async def run_batch(payloads, on_result):
+    """Upload all (name, bytes, content type) payloads concurrently, calling
+    on_result(index, data) as each one finishes; data is the response JSON or the
+    exception raised"""
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit=2 * BATCH_CONCURRENCY, keepalive_timeout=30)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        async def upload(index, payload):
+            try:
+                return index, await _upload_one(session, sem, payload)
+            except (aiohttp.ClientError, asyncio.TimeoutError, orjson.JSONDecodeError) as e:
+                return index, e
+        
+        for next_done in asyncio.as_completed([upload(i, p) for i, p in enumerate(payloads)]):
+            on_result(*await next_done)
+
+def pretty_json(obj):
+    """2-space indented JSON text, for st.code rather than re-serializing via st.json"""
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+
+def render_batch_result(placeholder, name, data):
+    """Fill a file's placeholder with its extraction result or error"""
+    if isinstance(data, Exception):
+        placeholder.error(f"Error processing {name}: {data}")
+        return
+    with placeholder.container():
+        st.subheader(f"Results for {name}")
+        st.write(f"**Document Type:** {data.get('document_type')} (Confidence: {data.get('confidence') or 0:.2f})")
+        st.code(pretty_json(data.get("entities", {})), language="json")
+
+st.sidebar.button("Refresh types", on_click=fetch_document_types.clear)
 doc_types, doc_type_fields = get_document_types()
 
 tabs = st.tabs(["Classify & Extract", "Batch Extract Entities"])
@@ -29,21 +121,31 @@ with tabs[0]:
     if uploaded_file:
         if st.button("Process Document", key="process_single"):
             with st.spinner("Processing..."):
-                files = {"file": (uploaded_file.name, uploaded_file, uploaded_file.type)}
-                params = {"include_raw_text": str(include_raw_text).lower()}
+                params = PARAMS_RAW_TEXT if include_raw_text else PARAMS_NO_RAW_TEXT
+                future = asyncio.run_coroutine_threadsafe(
+                    upload_client.post(
+                        f"{API_URL}/extract_entities",
+                        files={"file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)},
+                        params=params
+                    ),
+                    upload_loop
+                )
                 try:
-                    resp = requests.post(f"{API_URL}/extract_entities", files=files, params=params)
+                    resp = future.result(timeout=UPLOAD_TIMEOUT)
                     resp.raise_for_status()
-                    result = resp.json()
+                    result = orjson.loads(resp.content)
                     st.success(f"Document classified as: {result['document_type']} (confidence: {result['confidence']:.2f})")
-                    st.json(result)
+                    st.code(pretty_json(result), language="json")
                     if "entities" in result:
                         st.subheader("Extracted Entities")
-                        st.json(result["entities"])
+                        st.code(pretty_json(result["entities"]), language="json")
                     if include_raw_text and "raw_text" in result:
                         st.subheader("Raw OCR Text")
                         st.code(result["raw_text"])
-                except Exception as e:
+                except concurrent.futures.TimeoutError:
+                    future.cancel()
+                    st.error(f"Error: no response after {UPLOAD_TIMEOUT}s")
+                except (httpx.HTTPError, orjson.JSONDecodeError) as e:
                     st.error(f"Error: {e}")
 
 # --- Tab 2: Batch Extract Entities ---
@@ -53,25 +155,17 @@ with tabs[1]:
     batch_files = st.file_uploader("Upload multiple documents (PDF, image)", type=["pdf", "png", "jpg", "jpeg", "tiff", "bmp"], accept_multiple_files=True, key="multi_upload")
     if batch_files:
         if st.button("Extract Entities from All", key="batch_extract"):
-            results = []
-            for file in batch_files:
-                with st.spinner(f"Processing {file.name}..."):
-                    files = {"file": (file.name, file, file.type)}
-                    try:
-                        resp = requests.post(f"{API_URL}/extract_entities", files=files)
-                        resp.raise_for_status()
-                        data = resp.json()
-                        results.append({
-                            "filename": file.name,
-                            "document_type": data.get("document_type"),
-                            "confidence": data.get("confidence"),
-                            "entities": data.get("entities", {})
-                        })
-                    except Exception as e:
-                        st.error(f"Error processing {file.name}: {e}")
-            if results:
-                st.success(f"Processed {len(results)} files.")
-                for res in results:
-                    st.subheader(f"Results for {res['filename']}")
-                    st.write(f"**Document Type:** {res['document_type']} (Confidence: {res.get('confidence', 0):.2f})")
-                    st.json(res["entities"])
+            # Read each upload once; the concurrent tasks share these bytes rather
+            # than the UploadedFile streams, whose position may already be at EOF
+            payloads = [(f.name, f.getvalue(), f.type or "application/octet-stream") for f in batch_files]
+            # Results are rendered into per-file slots as soon as each upload finishes
+            with st.status(f"Processing {len(payloads)} files...", expanded=True) as status:
+                placeholders = [st.empty() for _ in payloads]
+                succeeded = []
+                
+                def on_result(index, data):
+                    succeeded.append(not isinstance(data, Exception))
+                    render_batch_result(placeholders[index], payloads[index][0], data)
+                
+                asyncio.run(run_batch(payloads, on_result))
+                status.update(label=f"Processed {sum(succeeded)} of {len(payloads)} files.", state="complete")